@@ -1,29 +1,143 @@
-from flask import Flask, request, jsonify, send_from_directory, abort, session
+from flask import Flask, Response, request, jsonify, send_from_directory, abort, session, stream_with_context
+from flask.json.provider import JSONProvider
+import atexit
+import hashlib
+import hmac
+import queue
 import sqlite3
 import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash, check_password_hash
-from functools import wraps
+from functools import lru_cache, wraps
+
+try:
+    import orjson
+except ImportError:  # optional C-accelerated JSON; stdlib json is the fallback
+    orjson = None
+
+class OrjsonProvider(JSONProvider):
+    """JSON provider backed by orjson's native encoder/decoder."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
 
 app = Flask(__name__)
 app.secret_key = 'C3zO7bxxx5'
 
-SONG_DIRECTORY = os.path.join(os.getcwd(), "songs")
+if orjson is not None:
+    app.json = OrjsonProvider(app)
+else:
+    app.json.sort_keys = False  # keep insertion order; sorting is wasted work
+
+app.config['SONG_DIRECTORY'] = os.path.join(os.getcwd(), "songs")
 app.config['DB_PATH'] = 'songs.db'
 
+# When running behind nginx/Apache with an internal location mapped to
+# SONG_DIRECTORY, set USE_X_SENDFILE=1 so /play responses carry only an
+# X-Sendfile header and the frontend serves the audio bytes from disk
+# via sendfile(2). Standalone/dev servers keep streaming the body.
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE', '').lower() in ('1', 'true')
+
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024
+# Cap in-memory buffering of non-file multipart form fields (ours are a
+# short title/author/duration, so tighten well below the 500KB default).
+# File parts are unaffected: Werkzeug always spools them through a
+# SpooledTemporaryFile past its own threshold.
+app.config['MAX_FORM_MEMORY_SIZE'] = 64 * 1024
 ALLOWED_EXTENSIONS = {'mp3'}
+_ALLOWED = frozenset(e.lower() for e in ALLOWED_EXTENSIONS)
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+class SQLiteConnectionPool:
+    """Small pool of reusable SQLite connections, keyed by database path."""
+
+    def __init__(self, maxsize=5):
+        self.maxsize = maxsize
+        self._pools = {}
+
+    def _new_connection(self, db_path):
+        # uri=True lets callers use sqlite URIs such as
+        # 'file::memory:?cache=shared'
+        conn = sqlite3.connect(db_path, uri=db_path.startswith('file:'),
+                               check_same_thread=False, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA cache_size=-20000')
+        return conn
+
+    @contextmanager
+    def connection(self, db_path):
+        pool = self._pools.setdefault(db_path, queue.Queue(maxsize=self.maxsize))
+        try:
+            conn = pool.get_nowait()
+        except queue.Empty:
+            conn = self._new_connection(db_path)
+        try:
+            yield conn
+        finally:
+            try:
+                pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    def dispose(self):
+        """Close all pooled connections."""
+        for pool in self._pools.values():
+            while True:
+                try:
+                    pool.get_nowait().close()
+                except queue.Empty:
+                    break
+        self._pools.clear()
+
+_connection_pool = SQLiteConnectionPool()
+atexit.register(_connection_pool.dispose)
+
+# SQL kept as module-level constants so every call passes the same string
+# object and hits the per-connection prepared-statement cache
+_SQL_INSERT_SONG = '''
+INSERT INTO songs (title, author, duration, music_file_url)
+VALUES (?, ?, ?, ?)
+'''
+_SQL_GET_SONG = 'SELECT title, author, duration, music_file_url FROM songs WHERE id = ?'
+_SQL_GET_ALL_SONGS = 'SELECT id, title, author, duration, music_file_url FROM songs'
+_SQL_DELETE_SONG = 'DELETE FROM songs WHERE id = ? RETURNING music_file_url'
+_SQL_SONG_FILE_REFERENCED = 'SELECT EXISTS(SELECT 1 FROM songs WHERE music_file_url = ?)'
+_SQL_GET_ALL_SONGS_JSON = '''
+SELECT json_group_array(
+    json_object('id', id, 'title', title, 'author', author,
+                'duration', duration, 'music_file_url', music_file_url)
+)
+FROM songs
+'''
+_SQL_INSERT_USER = 'INSERT INTO users (username, password, role) VALUES (?, ?, ?)'
+_SQL_GET_USER_BY_NAME = 'SELECT id, password, role FROM users WHERE username = ?'
+
+# Database paths whose schema has already been ensured in this process
+_initialized = set()
 
 class DatabaseService:
     """Handles database interactions."""
-    
+
     def __init__(self, db_path):
         self.db_path = db_path
         self.init_db()
 
+    def _conn(self):
+        return _connection_pool.connection(self.db_path)
+
     def init_db(self):
-        if not os.path.exists(self.db_path):
-            conn = sqlite3.connect(self.db_path)
+        # One-shot per path: CREATE TABLE IF NOT EXISTS makes re-runs
+        # harmless, the guard makes them free
+        if self.db_path in _initialized:
+            return
+        with self._conn() as conn:
             cursor = conn.cursor()
             cursor.execute('''
             CREATE TABLE IF NOT EXISTS songs (
@@ -38,40 +152,110 @@ class DatabaseService:
             CREATE TABLE IF NOT EXISTS users (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 username TEXT NOT NULL UNIQUE,
-                password TEXT NOT NULL
+                password TEXT NOT NULL,
+                role TEXT NOT NULL DEFAULT 'user'
             )
             ''')
+            # Migrate databases created before the role column existed
+            try:
+                cursor.execute("ALTER TABLE users ADD COLUMN role TEXT NOT NULL DEFAULT 'user'")
+            except sqlite3.OperationalError:
+                pass  # column already present
+            else:
+                # The DEFAULT demotes every pre-existing account; restore
+                # the admin user's role in the same transaction
+                cursor.execute("UPDATE users SET role = 'admin' WHERE username = 'admin'")
             conn.commit()
-            conn.close()
+        _initialized.add(self.db_path)
 
     def add_song(self, title, author, duration, music_file_url):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-        INSERT INTO songs (title, author, duration, music_file_url)
-        VALUES (?, ?, ?, ?)
-        ''', (title, author, duration, music_file_url))
-        song_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        return song_id
+        with self._conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute(_SQL_INSERT_SONG, (title, author, duration, music_file_url))
+            song_id = cursor.lastrowid
+            conn.commit()
+            return song_id
+
+    def add_songs(self, rows):
+        """Bulk-insert (title, author, duration, music_file_url) rows in one transaction."""
+        with self._conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN')
+            try:
+                cursor.executemany(_SQL_INSERT_SONG, rows)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            return cursor.rowcount
 
     def get_song(self, song_id):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('SELECT title, author, duration, music_file_url FROM songs WHERE id = ?', (song_id,))
-        song = cursor.fetchone()
-        conn.close()
-        return song
+        with self._conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute(_SQL_GET_SONG, (song_id,))
+            return cursor.fetchone()
+
+    def delete_song(self, song_id):
+        """Delete a song row.
+
+        Returns (music_file_url, still_referenced), where still_referenced
+        tells whether another row shares the same file, or None if the
+        song does not exist. Content-addressed storage dedupes identical
+        uploads, so the file may only be unlinked once the last row
+        referencing it is gone.
+        """
+        with self._conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN')
+            try:
+                cursor.execute(_SQL_DELETE_SONG, (song_id,))
+                row = cursor.fetchone()
+                if row is None:
+                    conn.commit()
+                    return None
+                cursor.execute(_SQL_SONG_FILE_REFERENCED, (row[0],))
+                still_referenced = bool(cursor.fetchone()[0])
+                conn.commit()
+                return row[0], still_referenced
+            except Exception:
+                conn.rollback()
+                raise
 
     def get_all_songs(self):
-        """Retrieve all songs metadata."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('SELECT id, title, author, duration, music_file_url FROM songs')
-        songs = cursor.fetchall()
-        conn.close()
-        return songs
+        """Retrieve all songs metadata as sqlite3.Row objects."""
+        with self._conn() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            cursor.arraysize = 200
+            cursor.execute(_SQL_GET_ALL_SONGS)
+            return cursor.fetchall()
+
+    def iter_all_songs(self, batch_size=500):
+        """Yield songs metadata as sqlite3.Row objects, fetched in batches."""
+        with self._conn() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            cursor.arraysize = batch_size
+            cursor.execute(_SQL_GET_ALL_SONGS)
+            while rows := cursor.fetchmany():
+                yield from rows
+
+    def get_all_songs_json(self):
+        """Retrieve all songs metadata as a ready-made JSON array string."""
+        with self._conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute(_SQL_GET_ALL_SONGS_JSON)
+            return cursor.fetchone()[0]
+
+# Explicit hash cost, calibrated for current hardware; bump when it gets cheap
+_HASH_METHOD = 'scrypt:32768:8:1'
+# Checked in place of the stored hash when a username does not exist, so
+# failed logins cost the same work either way
+_DUMMY_HASH = generate_password_hash("x", method=_HASH_METHOD)
+
+# hashlib's scrypt releases the GIL, so hashing in a worker thread lets
+# other requests make progress while a login is verified
+_HASH_POOL = ThreadPoolExecutor(max_workers=os.cpu_count())
 
 class AuthService:
     """Handles user authentication and authorization."""
@@ -79,45 +263,48 @@ class AuthService:
     def __init__(self, db_path):
         self.db_path = db_path
 
+    def _conn(self):
+        return _connection_pool.connection(self.db_path)
+
     def register_user(self, username, password):
-        hashed_password = generate_password_hash(password)
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute("INSERT INTO users (username, password) VALUES (?, ?)", (username, hashed_password))
-            conn.commit()
-            conn.close()
-            return True
-        except sqlite3.IntegrityError:
-            conn.close()
-            return False
+        hashed_password = _HASH_POOL.submit(generate_password_hash, password, method=_HASH_METHOD).result()
+        role = 'admin' if hmac.compare_digest((username or "").encode(), b"admin") else 'user'
+        with self._conn() as conn:
+            try:
+                cursor = conn.cursor()
+                cursor.execute(_SQL_INSERT_USER, (username, hashed_password, role))
+                conn.commit()
+                return True
+            except sqlite3.IntegrityError:
+                return False
 
     def verify_user(self, username, password):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, password FROM users WHERE username = ?", (username,))
-        user = cursor.fetchone()
-        conn.close()
-
-        if user and check_password_hash(user[1], password):
-            return user[0]  # Return user ID on successful authentication
+        with self._conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute(_SQL_GET_USER_BY_NAME, (username,))
+            user = cursor.fetchone()
+
+        # Always run the hash check so unknown usernames cost the same
+        # work as a wrong password
+        ok = _HASH_POOL.submit(check_password_hash, user[1] if user else _DUMMY_HASH, password or "").result()
+        if user and ok:
+            return user[0], user[2]  # Return (user ID, role) on successful authentication
         return None
 
-    def get_username_by_id(self, user_id):
-        """Get the username by user_id."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT username FROM users WHERE id = ?", (user_id,))
-        user = cursor.fetchone()
-        conn.close()
-        return user[0] if user else None
-
 # Instantiate services
 db_service = DatabaseService(app.config['DB_PATH'])
 auth_service = AuthService(app.config['DB_PATH'])
 
+# Song metadata is immutable while a song exists, so hot /songs/<id> and
+# /play/<id> lookups can come from a small in-process LRU; it is cleared
+# whenever the catalog changes
+@lru_cache(maxsize=4096)
+def _cached_get_song(song_id):
+    return db_service.get_song(song_id)
+
 def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    head, dot, ext = filename.rpartition('.')
+    return bool(dot) and ext.lower() in _ALLOWED
 
 # Authentication decorator
 def login_required(f):
@@ -128,15 +315,31 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+# Authorization decorator for admin-only endpoints
+def admin_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        # The role is cached in the signed session at login time,
+        # so no DB round trip is needed here
+        if session.get('role') != 'admin':
+            return jsonify({"error": "You do not have permission to perform this action"}), 403
+        return f(*args, **kwargs)
+    return decorated_function
+
 @app.route('/register', methods=['POST'])
 def register():
-    data = request.get_json()
+    data = request.get_json(silent=True) or {}
     username = data.get('username')
     password = data.get('password')
 
-    if not username or not password:
+    if not isinstance(username, str) or not isinstance(password, str) \
+            or not username or not password:
         return jsonify({"error": "Username and password are required"}), 400
 
+    # Reject absurd inputs before they reach the deliberately slow hash
+    if len(password) > 1024:
+        return jsonify({"error": "Password is too long"}), 400
+
     if auth_service.register_user(username, password):
         return jsonify({"message": "User registered successfully"}), 201
     else:
@@ -144,13 +347,21 @@ def register():
 
 @app.route('/login', methods=['POST'])
 def login():
-    data = request.get_json()
+    data = request.get_json(silent=True) or {}
     username = data.get('username')
     password = data.get('password')
 
-    user_id = auth_service.verify_user(username, password)
-    if user_id:
-        session['user_id'] = user_id
+    if not isinstance(username, str) or not isinstance(password, str) \
+            or not username or not password:
+        return jsonify({"error": "Username and password are required"}), 400
+
+    # Reject absurd inputs before they reach the deliberately slow hash
+    if len(password) > 1024:
+        return jsonify({"error": "Password is too long"}), 400
+
+    user = auth_service.verify_user(username, password)
+    if user:
+        session['user_id'], session['role'] = user
         return jsonify({"message": "Login successful"}), 200
     else:
         return jsonify({"error": "Invalid username or password"}), 401
@@ -159,17 +370,13 @@ def login():
 @login_required
 def logout():
     session.pop('user_id', None)
+    session.pop('role', None)
     return jsonify({"message": "Logged out successfully"}), 200
 
 @app.route('/upload', methods=['POST'])
 @login_required
+@admin_required
 def upload_song():
-    # Check if the logged-in user is admin
-    user_id = session.get('user_id')
-    username = auth_service.get_username_by_id(user_id)
-    if username != "admin":
-        return jsonify({"error": "You do not have permission to upload songs"}), 403
-
     if 'file' not in request.files:
         return jsonify({"error": "No file part"}), 400
 
@@ -184,12 +391,33 @@ def upload_song():
     duration = int(duration)
 
     if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        file_path = os.path.join(SONG_DIRECTORY, filename)
-        file.save(file_path)
+        # Stream to a temp file in fixed-size chunks, hashing as we go;
+        # the rename keeps the final path free of partial writes
+        hasher = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=app.config['SONG_DIRECTORY'], suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as dst:
+                while chunk := file.stream.read(UPLOAD_CHUNK_SIZE):
+                    hasher.update(chunk)
+                    dst.write(chunk)
+
+            # Content-addressed name: identical audio uploaded under
+            # different names maps to one file on disk
+            ext = secure_filename(file.filename).rpartition('.')[2].lower()
+            filename = f"{hasher.hexdigest()[:32]}.{ext}"
+            file_path = os.path.join(app.config['SONG_DIRECTORY'], filename)
+            if os.path.exists(file_path):
+                os.unlink(tmp_path)
+            else:
+                os.replace(tmp_path, file_path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
 
         music_file_url = filename
         song_id = db_service.add_song(title, author, duration, music_file_url)
+        _cached_get_song.cache_clear()
 
         return jsonify({
             "message": "Song uploaded successfully",
@@ -204,38 +432,31 @@ def upload_song():
 
 @app.route('/songs/<int:song_id>', methods=['DELETE'])
 @login_required
+@admin_required
 def delete_song(song_id):
-    # Check if the logged-in user is admin
-    user_id = session.get('user_id')
-    username = auth_service.get_username_by_id(user_id)
-    if username != "admin":
-        return jsonify({"error": "You do not have permission to delete songs"}), 403
-
     # Try to delete the song from the database
-    conn = sqlite3.connect(app.config['DB_PATH'])
-    cursor = conn.cursor()
-    cursor.execute('SELECT music_file_url FROM songs WHERE id = ?', (song_id,))
-    song = cursor.fetchone()
-
-    if song:
-        # Remove the song file from the directory
-        file_path = os.path.join(SONG_DIRECTORY, song[0])
-        if os.path.exists(file_path):
-            os.remove(file_path)
-
-        # Remove song from the database
-        cursor.execute('DELETE FROM songs WHERE id = ?', (song_id,))
-        conn.commit()
-        conn.close()
-        return jsonify({"message": "Song deleted successfully"}), 200
-    else:
-        conn.close()
+    deleted = db_service.delete_song(song_id)
+    if deleted is None:
         return jsonify({"error": "Song not found"}), 404
+    _cached_get_song.cache_clear()
+
+    music_file_url, still_referenced = deleted
+    # The file is shared between duplicate uploads; only unlink it once
+    # the last row referencing it is gone. One syscall, no exists/remove
+    # race
+    if not still_referenced:
+        file_path = os.path.join(app.config['SONG_DIRECTORY'], music_file_url)
+        try:
+            os.unlink(file_path)
+        except FileNotFoundError:
+            pass
+
+    return jsonify({"message": "Song deleted successfully"}), 200
 
 @app.route('/songs/<int:song_id>')
 @login_required
 def serve_song(song_id):
-    song = db_service.get_song(song_id)
+    song = _cached_get_song(song_id)
     if song:
         song_data = {
             'id': song_id,
@@ -251,30 +472,34 @@ def serve_song(song_id):
 @app.route('/songs', methods=['GET'])
 @login_required
 def get_all_songs():
-    songs = db_service.get_all_songs()
-    song_list = []
-    for song in songs:
-        song_data = {
-            'id': song[0],
-            'title': song[1],
-            'author': song[2],
-            'duration': song[3],
-            'music_file_url': song[4]
-        }
-        song_list.append(song_data)
-    
-    return jsonify(song_list), 200
+    # Stream the JSON array so rows go out as they are read from SQLite
+    # instead of materializing the whole catalog in memory first;
+    # get_all_songs_json remains for callers that want one payload
+    def generate():
+        yield '['
+        prefix = ''
+        for row in db_service.iter_all_songs():
+            yield prefix + app.json.dumps(dict(row))
+            prefix = ','
+        yield ']'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
 
 @app.route('/play/<int:song_id>')
 def play_song(song_id):
-    song = db_service.get_song(song_id)
+    song = _cached_get_song(song_id)
     if song:
         song_file = song[3]
-        return send_from_directory(SONG_DIRECTORY, song_file, as_attachment=False)
+        # conditional=True enables ETag/Last-Modified revalidation and 206
+        # partial responses, so seeking re-fetches only the requested range
+        response = send_from_directory(app.config['SONG_DIRECTORY'], song_file, as_attachment=False,
+                                       conditional=True, max_age=31536000)
+        response.headers.setdefault('Accept-Ranges', 'bytes')
+        return response
     else:
         abort(404)
 
 if __name__ == "__main__":
-    if not os.path.exists(SONG_DIRECTORY):
-        os.makedirs(SONG_DIRECTORY)
+    if not os.path.exists(app.config['SONG_DIRECTORY']):
+        os.makedirs(app.config['SONG_DIRECTORY'])
     app.run(debug=True)
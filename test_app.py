@@ -1,6 +1,6 @@
 import unittest
 import os
-from app import app, db_service, auth_service  # Replace 'app' with your actual filename if needed
+from app import app, db_service, auth_service, _cached_get_song, _connection_pool, _initialized  # Replace 'app' with your actual filename if needed
 
 SONG_DIRECTORY = os.path.join(os.getcwd(), "songs_test")
 
@@ -10,7 +10,11 @@ class FlaskAppTests(unittest.TestCase):
         self.client = app.test_client()
         app.config['TESTING'] = True
         app.config['SECRET_KEY'] = 'test_secret_key'
-        app.config['DB_PATH'] = 'test.db'
+        # Keep uploads out of the app's real songs/ directory
+        app.config['SONG_DIRECTORY'] = SONG_DIRECTORY
+        # Shared-cache in-memory DB: all pooled connections see the same
+        # database and nothing touches the filesystem
+        app.config['DB_PATH'] = 'file::memory:?cache=shared'
 
         db_service.db_path = app.config['DB_PATH']
         auth_service.db_path = app.config['DB_PATH']
@@ -22,8 +26,10 @@ class FlaskAppTests(unittest.TestCase):
 
     def tearDown(self):
         """Cleanup operations after each test."""
-        if os.path.exists(db_service.db_path):
-            os.remove(db_service.db_path)
+        # Closing the last pooled connection discards the in-memory DB
+        _connection_pool.dispose()
+        _initialized.discard(db_service.db_path)
+        _cached_get_song.cache_clear()
 
         for filename in os.listdir(SONG_DIRECTORY):
             file_path = os.path.join(SONG_DIRECTORY, filename)
@@ -99,5 +105,42 @@ class FlaskAppTests(unittest.TestCase):
             self.assertEqual(response.status_code, 200)
             self.assertIn("Song uploaded successfully", response.get_json().get("message"))
 
+    def test_delete_duplicate_upload_keeps_shared_file(self):
+        """Deleting one of two identical uploads must not remove the other's audio."""
+        auth_service.register_user('admin', 'adminpassword')
+        self.client.post('/login', json={'username': 'admin', 'password': 'adminpassword'})
+
+        with open(os.path.join(SONG_DIRECTORY, 'test.mp3'), 'wb') as f:
+            f.write(b"fake audio data")
+
+        ids = []
+        for title in ('First Copy', 'Second Copy'):
+            with open(os.path.join(SONG_DIRECTORY, 'test.mp3'), 'rb') as test_file:
+                data = {
+                    'title': title,
+                    'author': 'Test Author',
+                    'duration': '180',
+                    'file': (test_file, 'test.mp3')
+                }
+                response = self.client.post('/upload', data=data, content_type='multipart/form-data')
+                self.assertEqual(response.status_code, 200)
+                ids.append(response.get_json().get("id"))
+
+        # Both rows share one content-addressed file on disk
+        music_file_url = self.client.get(f'/songs/{ids[1]}').get_json().get("music_file_url")
+        file_path = os.path.join(SONG_DIRECTORY, music_file_url)
+        self.assertTrue(os.path.exists(file_path))
+
+        # Deleting the first copy must leave the shared file playable
+        response = self.client.delete(f'/songs/{ids[0]}')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(os.path.exists(file_path))
+        self.assertEqual(self.client.get(f'/play/{ids[1]}').status_code, 200)
+
+        # Deleting the last copy removes the file
+        response = self.client.delete(f'/songs/{ids[1]}')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(os.path.exists(file_path))
+
 if __name__ == '__main__':
     unittest.main()